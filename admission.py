@@ -0,0 +1,139 @@
+import time
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+# =========================
+# Admission Control
+# =========================
+# A fixed number of slots guard the embedding/search stage. Public queries
+# wait in a short bounded queue and are shed (503 + Retry-After) when it is
+# full or the wait times out, instead of piling up until every request
+# times out. Admin ingestion runs in its own lane: it is capped to a few
+# slots and only admitted while no query is waiting.
+
+LANES = ("query", "ingest")
+
+class Overloaded(Exception):
+    """Raised when a request is shed by the admission controller"""
+
+class AdmissionController:
+    """Concurrency limiter with a bounded wait queue and two priority lanes"""
+
+    def __init__(self, slots, max_queue, queue_timeout, ingest_slots=1, ingest_timeout=30):
+        self.slots = slots
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.ingest_slots = ingest_slots
+        self.ingest_timeout = ingest_timeout
+
+        self._cond = threading.Condition()
+        self.active = {lane: 0 for lane in LANES}
+        self.waiting = {lane: 0 for lane in LANES}
+        self.admitted = {lane: 0 for lane in LANES}
+        self.shed = {lane: 0 for lane in LANES}
+        self.peak_waiting = 0
+
+    def _can_run(self, lane):
+        if self.active["query"] + self.active["ingest"] >= self.slots:
+            return False
+        if lane == "ingest":
+            return self.active["ingest"] < self.ingest_slots and self.waiting["query"] == 0
+        return True
+
+    def is_saturated(self, lane="query"):
+        """True if a new request in lane would be shed without waiting"""
+        with self._cond:
+            return not self._can_run(lane) and lane == "query" and self.waiting["query"] >= self.max_queue
+
+    def record_shed(self, lane="query"):
+        """Count a request shed outside admit() (e.g. by an async front end)"""
+        with self._cond:
+            self.shed[lane] += 1
+
+    @contextmanager
+    def admit(self, lane="query", timeout=-1):
+        """Hold a slot for the duration of the block; raises Overloaded if shed.
+
+        timeout defaults to the lane's timeout; None waits indefinitely
+        (background jobs).
+        """
+        if timeout == -1:
+            timeout = self.queue_timeout if lane == "query" else self.ingest_timeout
+
+        with self._cond:
+            if not self._can_run(lane):
+                if lane == "query" and self.waiting["query"] >= self.max_queue:
+                    self.shed[lane] += 1
+                    raise Overloaded("Query queue is full")
+
+                deadline = None if timeout is None else time.monotonic() + timeout
+                self.waiting[lane] += 1
+                self.peak_waiting = max(self.peak_waiting, self.waiting["query"])
+                try:
+                    while not self._can_run(lane):
+                        remaining = None if deadline is None else deadline - time.monotonic()
+                        if remaining is not None and remaining <= 0:
+                            self.shed[lane] += 1
+                            raise Overloaded(f"Timed out waiting for a {lane} slot")
+                        self._cond.wait(remaining)
+                finally:
+                    self.waiting[lane] -= 1
+                    # A query leaving the queue may unblock ingestion
+                    self._cond.notify_all()
+
+            self.active[lane] += 1
+            self.admitted[lane] += 1
+
+        try:
+            yield
+        finally:
+            with self._cond:
+                self.active[lane] -= 1
+                self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            return {
+                "slots": self.slots,
+                "max_queue": self.max_queue,
+                "active": dict(self.active),
+                "queue_depth": dict(self.waiting),
+                "peak_queue_depth": self.peak_waiting,
+                "admitted": dict(self.admitted),
+                "shed": dict(self.shed),
+            }
+
+class ResponseCache:
+    """Small thread-safe LRU of query responses, cleared whenever the KB changes"""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._items:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return self._items[key]
+
+    def put(self, key, value):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def stats(self):
+        with self._lock:
+            return {"size": len(self._items), "hits": self.hits, "misses": self.misses}
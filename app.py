@@ -1,7 +1,6 @@
 import os
-import json
 import time
-import pdfplumber
+import threading
 import numpy as np
 import re
 from flask import (
@@ -11,6 +10,15 @@ from flask import (
 from flask_session import Session
 from werkzeug.utils import secure_filename
 from sentence_transformers import SentenceTransformer
+from knowledge_base import (
+    PartitionedIndex, source_metadata, parse_date_bound, normalize_tags,
+    load_json, save_json, chunk_text, extract_pdf_text,
+    load_embedding_store, save_embedding_store, text_key,
+    configured_model, UPLOAD_DIR, KB_FILE, UPLOAD_LOGS, EMBEDDINGS_DIR, ACTIVE_MODEL_FILE, CHUNK_SIZE
+)
+from reindex import Reindexer
+from admission import AdmissionController, ResponseCache, Overloaded
+from snapshot import SNAPSHOT_DIR, SnapshotError, ReplicaPoller, export_snapshot
 
 # =========================
 # Flask Setup
@@ -27,16 +35,35 @@ Session(app)
 # Constants
 # =========================
 ADMIN_TOKEN = os.getenv('ADMIN_TOKEN', 'change-me-in-production')  # Change this in production!
-UPLOAD_DIR = "uploads_exp"
-KB_FILE = "knowledge_base_exp.json"
-UPLOAD_LOGS = "upload_logs.json"
+# UPLOAD_DIR, KB_FILE, UPLOAD_LOGS and EMBEDDINGS_DIR live in knowledge_base.py (shared with ingest.py)
 
 # Performance & Scalability Settings
 MAX_FILE_SIZE_MB = 10
 MAX_TOTAL_CHUNKS = 10000  # Warning threshold
-CHUNK_SIZE = 250
-MIN_CHUNK_WORDS = 30
 BATCH_SIZE = 100  # For processing large KBs
+REINDEX_BATCH_SIZE = 64  # Chunks per background re-index batch
+REINDEX_THROTTLE_S = 0.05  # Pause between re-index batches so /query keeps priority
+REINDEX_GATE_TIMEOUT_S = 5.0  # A queued re-index batch re-checks for cancellation this often
+
+# Admission Control (embedding + search stage)
+QUERY_CONCURRENCY = 4  # Searches running at once
+QUERY_QUEUE_SIZE = 16  # Searches allowed to wait for a slot; more are shed
+QUERY_QUEUE_TIMEOUT_S = 2.0  # Max wait before a queued search is shed
+INGEST_CONCURRENCY = 1  # Slots admin ingestion may use, only while no query waits
+INGEST_QUEUE_TIMEOUT_S = 30.0
+RETRY_AFTER_S = 2  # Retry-After sent with 503 responses
+RESPONSE_CACHE_SIZE = 1024
+
+# Snapshots & Read Replicas
+# A replica serves the newest bundle in REPLICA_SNAPSHOT_DIR (shared storage)
+# instead of loading KB_FILE, and rejects KB writes
+REPLICA_SNAPSHOT_DIR = os.getenv("REPLICA_SNAPSHOT_DIR")
+REPLICA_POLL_S = float(os.getenv("REPLICA_POLL_S", 10))
+# Checksum the bundle before serving it at startup. Off by default: hashing reads
+# the whole matrix before the first query, which the memory map avoids. Hot-swaps
+# are always verified, on the poller thread
+REPLICA_VERIFY = os.getenv("REPLICA_VERIFY") == "1"
+SNAPSHOT_ON_WRITE = os.getenv("SNAPSHOT_ON_WRITE") == "1"  # Publish a bundle after each KB write
 
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 os.makedirs("flask_sessions", exist_ok=True)
@@ -44,37 +71,64 @@ os.makedirs("flask_sessions", exist_ok=True)
 # =========================
 # Embedding Model
 # =========================
-embedder = SentenceTransformer("all-MiniLM-L6-v2")
+# EMBEDDING_MODEL (env) wins; otherwise the last model promoted through
+# /admin/reindex is used. Each index is tagged with the model that built it.
+EMBEDDING_MODEL = configured_model()
+embedders = {EMBEDDING_MODEL: SentenceTransformer(EMBEDDING_MODEL)}
+admission = AdmissionController(
+    QUERY_CONCURRENCY, QUERY_QUEUE_SIZE, QUERY_QUEUE_TIMEOUT_S,
+    INGEST_CONCURRENCY, INGEST_QUEUE_TIMEOUT_S
+)
+response_cache = ResponseCache(RESPONSE_CACHE_SIZE)
+degraded_mode = False  # When set, /query answers only from the intent router and cache
+reindexer = Reindexer(
+    SentenceTransformer, EMBEDDINGS_DIR, REINDEX_BATCH_SIZE, REINDEX_THROTTLE_S,
+    gate=lambda: admission.admit("ingest", timeout=REINDEX_GATE_TIMEOUT_S)
+)
 
 kb_docs = []
-kb_embeddings = None
+kb_index = PartitionedIndex(EMBEDDING_MODEL)
+kb_lock = threading.Lock()  # Serialises KB writes: upload, delete, model cutover
+kb_generation = 0  # Bumped on every KB write; part of the response cache key
+snapshot_version = None  # Bundle being served (replicas) or last published
 
 # =========================
 # Helpers
 # =========================
-def load_json(path):
-    if not os.path.exists(path):
-        return []
-    with open(path, "r", encoding="utf-8") as f:
-        return json.load(f)
-
-def save_json(path, data):
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2)
-
-def chunk_text(text, size=250):
-    """Split text into chunks with improved memory efficiency"""
-    words = text.split()
-    chunks = []
-    for i in range(0, len(words), size):
-        chunk = " ".join(words[i:i + size])
-        if len(words[i:i + size]) > 30:
-            chunks.append(chunk)
-    return chunks
+def embed_texts(texts, model_id=None):
+    """Encode texts into normalised embeddings, batching large inputs"""
+    embedder = embedders[model_id or EMBEDDING_MODEL]
+
+    # Process in batches for large KBs
+    if len(texts) > BATCH_SIZE:
+        all_embeddings = []
+        for i in range(0, len(texts), BATCH_SIZE):
+            batch = texts[i:i + BATCH_SIZE]
+            batch_embeddings = embedder.encode(
+                batch,
+                convert_to_numpy=True,
+                normalize_embeddings=True,
+                show_progress_bar=False
+            )
+            all_embeddings.append(batch_embeddings)
+        return np.vstack(all_embeddings)
+
+    return embedder.encode(
+        texts,
+        convert_to_numpy=True,
+        normalize_embeddings=True,
+        show_progress_bar=False
+    )
+
+def kb_changed():
+    """Invalidate cached answers after a KB write; call with kb_lock held"""
+    global kb_generation
+    kb_generation += 1
+    response_cache.clear()
 
 def load_kb():
     """Load knowledge base with improved error handling and memory management"""
-    global kb_docs, kb_embeddings
+    global kb_docs, kb_index
     
     try:
         kb_docs = load_json(KB_FILE)
@@ -84,7 +138,7 @@ def load_kb():
             kb_docs = kb_docs[0]
         
         if not kb_docs:
-            kb_embeddings = None
+            kb_index = PartitionedIndex(EMBEDDING_MODEL)
             print("ℹ️ Knowledge base is empty")
             return
             
@@ -92,46 +146,102 @@ def load_kb():
         if not isinstance(kb_docs, list) or not all(isinstance(d, dict) and "text" in d for d in kb_docs):
             print(f"❌ Error: Invalid knowledge base format in {KB_FILE}")
             kb_docs = []
-            kb_embeddings = None
+            kb_index = PartitionedIndex(EMBEDDING_MODEL)
             return
         
         # Check if KB is getting too large
         if len(kb_docs) > MAX_TOTAL_CHUNKS:
             print(f"⚠️ Warning: Knowledge base has {len(kb_docs)} chunks (threshold: {MAX_TOTAL_CHUNKS})")
         
-        # Generate embeddings with progress indication
+        # Reuse stored embeddings and only encode chunks that are new or changed
         print(f"🔄 Loading {len(kb_docs)} knowledge chunks...")
         texts = [d["text"] for d in kb_docs]
-        
-        # Process in batches for large KBs
-        if len(texts) > BATCH_SIZE:
-            all_embeddings = []
-            for i in range(0, len(texts), BATCH_SIZE):
-                batch = texts[i:i + BATCH_SIZE]
-                batch_embeddings = embedder.encode(
-                    batch,
-                    convert_to_numpy=True,
-                    normalize_embeddings=True,
-                    show_progress_bar=False
-                )
-                all_embeddings.append(batch_embeddings)
-            kb_embeddings = np.vstack(all_embeddings)
+        stored_rows, stored = load_embedding_store(EMBEDDINGS_DIR, EMBEDDING_MODEL)
+        keys = [text_key(t) for t in texts]
+        missing = [i for i, key in enumerate(keys) if key not in stored_rows]
+
+        if missing:
+            print(f"🔄 Embedding {len(missing)} new or changed chunks...")
+            fresh = embed_texts([texts[i] for i in missing])
+            embeddings = np.zeros((len(texts), fresh.shape[1]), dtype=np.float32)
+            embeddings[missing] = fresh
         else:
-            kb_embeddings = embedder.encode(
-                texts,
-                convert_to_numpy=True,
-                normalize_embeddings=True,
-                show_progress_bar=False
-            )
+            embeddings = np.zeros((len(texts), stored.shape[1]), dtype=np.float32)
+
+        reused = [i for i, key in enumerate(keys) if key in stored_rows]
+        if reused:
+            embeddings[reused] = stored[[stored_rows[keys[i]] for i in reused]]
+        if missing or len(stored) != len(texts):
+            save_embedding_store(EMBEDDINGS_DIR, EMBEDDING_MODEL, texts, embeddings)
+
+        kb_index = PartitionedIndex.build(
+            kb_docs, embeddings, source_metadata(kb_docs), model_id=EMBEDDING_MODEL
+        )
         
         print(f"✅ Knowledge base loaded successfully: {len(kb_docs)} chunks")
         
     except Exception as e:
         print(f"❌ Error loading knowledge base: {str(e)}")
         kb_docs = []
-        kb_embeddings = None
+        kb_index = PartitionedIndex(EMBEDDING_MODEL)
+
+# =========================
+# Snapshots
+# =========================
+def apply_snapshot(manifest, docs, index, logs):
+    """Hot-swap to a loaded snapshot bundle (read replicas)"""
+    global kb_docs, kb_index, EMBEDDING_MODEL, snapshot_version
+    model_id = manifest["model"]
+    if model_id not in embedders:
+        embedders[model_id] = SentenceTransformer(model_id)
+    with kb_lock:
+        # In-flight queries may still hold the current index, so its model
+        # stays loaded until the next swap; anything older can go
+        for stale in [m for m in embedders if m not in (model_id, kb_index.model_id)]:
+            del embedders[stale]
+        kb_docs = docs
+        kb_index = index
+        EMBEDDING_MODEL = model_id
+        snapshot_version = manifest["version"]
+        kb_changed()
+        save_json(UPLOAD_LOGS, logs)
+    print(f"✅ Serving snapshot v{manifest['version']}: {manifest['chunks']} chunks, model {model_id}")
 
-load_kb()
+def publish_snapshot():
+    """Export the live index as the next snapshot version"""
+    global snapshot_version
+    manifest = export_snapshot(SNAPSHOT_DIR, kb_index, load_json(UPLOAD_LOGS))
+    snapshot_version = manifest["version"]
+    print(f"✅ Published snapshot v{snapshot_version}")
+    return manifest
+
+def snapshot_after_write():
+    """Publish a snapshot after a KB write when SNAPSHOT_ON_WRITE is set"""
+    if not SNAPSHOT_ON_WRITE:
+        return
+    try:
+        publish_snapshot()
+    except (SnapshotError, OSError) as e:
+        # The write itself succeeded; replicas catch up on the next publish
+        print(f"⚠️ Snapshot publish failed: {str(e)}")
+
+def replica_read_only():
+    """Error response for KB writes on a read replica, else None"""
+    if REPLICA_SNAPSHOT_DIR:
+        return jsonify({"error": "This node is a read replica; make changes on the primary"}), 409
+    return None
+
+if REPLICA_SNAPSHOT_DIR:
+    replica_poller = ReplicaPoller(REPLICA_SNAPSHOT_DIR, REPLICA_POLL_S, apply_snapshot)
+    try:
+        if not replica_poller.poll(verify=REPLICA_VERIFY):
+            print(f"ℹ️ No snapshot in {REPLICA_SNAPSHOT_DIR} yet; waiting for one")
+    except (SnapshotError, OSError, ValueError) as e:
+        print(f"❌ Error loading snapshot: {str(e)}")
+    replica_poller.start()
+else:
+    replica_poller = None
+    load_kb()
 
 # =========================
 # Conversational AI Helper
@@ -436,13 +546,13 @@ def admin_login():
 # =========================
 # Admin Pages
 # =========================
-@app.route("/admin")
-def admin_page():
-    return send_from_directory("static", "admin.html")
-
 @app.route("/admin/upload", methods=["POST"])
 def admin_upload():
+    global kb_docs
     require_admin()
+    read_only = replica_read_only()
+    if read_only:
+        return read_only
 
     file = request.files.get("file")
     if not file:
@@ -476,19 +586,7 @@ def admin_upload():
         file.save(path)
 
         # Extract text with page tracking
-        text = ""
-        page_count = 0
-        with pdfplumber.open(path) as pdf:
-            page_count = len(pdf.pages)
-            
-            # Warn if very large PDF
-            if page_count > 100:
-                print(f"⚠️ Large PDF detected: {page_count} pages")
-            
-            for page_num, page in enumerate(pdf.pages):
-                page_text = page.extract_text()
-                if page_text:
-                    text += f"[Page {page_num + 1}] {page_text}\n"
+        text, page_count = extract_pdf_text(path)
 
         if not text.strip():
             os.remove(path)
@@ -510,23 +608,42 @@ def admin_upload():
                 "error": f"Adding this file would exceed the maximum chunk limit ({MAX_TOTAL_CHUNKS}). Current: {current_chunk_count}, Would add: {len(chunks)}. Please delete some documents first."
             }), 400
 
-        # Remove existing chunks from this file (handle re-uploads)
-        global kb_docs
-        kb_docs = [d for d in kb_docs if d.get("source") != filename]
+        tags = normalize_tags(request.form.get("tags", ""))
+        uploaded_at = time.strftime("%Y-%m-%d %H:%M:%S")
 
-        # Add new chunks
-        start_id = max([d.get("id", 0) for d in kb_docs], default=0)
-        for i, chunk in enumerate(chunks):
-            kb_docs.append({
-                "id": start_id + i + 1,
-                "source": filename,
-                "text": chunk.strip(),
-                "page_info": f"{page_count} pages"
-            })
+        texts = [chunk.strip() for chunk in chunks]
+        while True:
+            # Embed only the new partition, in the ingestion lane so queries keep
+            # priority, and outside kb_lock so deletes and promotion aren't blocked
+            model_id = kb_index.model_id
+            with admission.admit("ingest"):
+                embeddings = embed_texts(texts, model_id)
 
-        # Save updated knowledge base
-        save_json(KB_FILE, kb_docs)
-        load_kb()
+            with kb_lock:
+                if kb_index.model_id != model_id:
+                    continue  # The model was switched meanwhile; embed again with the new one
+
+                # Add new chunks, replacing existing ones from this file (handle re-uploads)
+                start_id = max([d.get("id", 0) for d in kb_docs if d.get("source") != filename], default=0)
+                new_docs = []
+                for i, text in enumerate(texts):
+                    new_docs.append({
+                        "id": start_id + i + 1,
+                        "source": filename,
+                        "text": text,
+                        "page_info": f"{page_count} pages",
+                        "uploaded_at": uploaded_at,
+                        "tags": tags
+                    })
+
+                # Save updated knowledge base
+                kb_docs = [d for d in kb_docs if d.get("source") != filename] + new_docs
+                save_json(KB_FILE, kb_docs)
+                kb_index.add_partition(filename, new_docs, embeddings, {"uploaded_at": uploaded_at, "tags": tags})
+                kb_changed()
+                live_docs, live_embeddings = kb_index.live_matrix()
+                save_embedding_store(EMBEDDINGS_DIR, kb_index.model_id, [d["text"] for d in live_docs], live_embeddings)
+                break
 
         # Update upload logs
         logs = load_json(UPLOAD_LOGS)
@@ -541,20 +658,28 @@ def admin_upload():
             "file_size": file_size,
             "file_size_mb": round(file_size / (1024 * 1024), 2),
             "pages": page_count,
-            "uploaded_at": time.strftime("%Y-%m-%d %H:%M:%S")
+            "tags": tags,
+            "uploaded_at": uploaded_at
         })
         
         save_json(UPLOAD_LOGS, logs)
+        snapshot_after_write()
 
         return jsonify({
             "success": True,
             "chunks_added": len(chunks),
             "filename": filename,
             "pages_processed": page_count,
+            "tags": tags,
             "total_chunks": len(kb_docs),
             "kb_health": "healthy" if len(kb_docs) < MAX_TOTAL_CHUNKS else "warning"
         })
 
+    except Overloaded:
+        if os.path.exists(path):
+            os.remove(path)
+        return jsonify({"error": "Server is busy answering queries. Please retry the upload shortly."}), 503, {"Retry-After": str(RETRY_AFTER_S)}
+
     except Exception as e:
         # Clean up file if processing failed
         if os.path.exists(path):
@@ -599,18 +724,23 @@ def admin_uploads():
 
 @app.route("/admin/delete/<filename>", methods=["DELETE"])
 def admin_delete_file(filename):
+    global kb_docs
     require_admin()
+    read_only = replica_read_only()
+    if read_only:
+        return read_only
     
     try:
         # Remove from knowledge base
-        global kb_docs
-        original_count = len(kb_docs)
-        kb_docs = [d for d in kb_docs if d.get("source") != filename]
-        chunks_removed = original_count - len(kb_docs)
-        
-        # Save updated knowledge base
-        save_json(KB_FILE, kb_docs)
-        load_kb()
+        with kb_lock:
+            original_count = len(kb_docs)
+            kb_docs = [d for d in kb_docs if d.get("source") != filename]
+            chunks_removed = original_count - len(kb_docs)
+
+            # Save updated knowledge base; dropping the partition needs no re-embedding
+            save_json(KB_FILE, kb_docs)
+            kb_index.drop_partition(filename)
+            kb_changed()
         
         # Remove from upload logs
         logs = load_json(UPLOAD_LOGS)
@@ -621,6 +751,7 @@ def admin_delete_file(filename):
         file_path = os.path.join(UPLOAD_DIR, filename)
         if os.path.exists(file_path):
             os.remove(file_path)
+        snapshot_after_write()
         
         return jsonify({
             "success": True,
@@ -655,74 +786,241 @@ def admin_stats():
         "max_chunks": MAX_TOTAL_CHUNKS
     })
 
-@app.route("/api/system-info")
-def system_info():
-    """Public endpoint for system status"""
-    return jsonify({
+# =========================
+# Embedding Model Swap
+# =========================
+def promote_candidate():
+    """Atomically cut /query over to the re-indexed model"""
+    global kb_index, EMBEDDING_MODEL
+    with kb_lock:
+        model_id, model, index = reindexer.promote(kb_docs, source_metadata(kb_docs))
+        embedders[model_id] = model
+        # Queries pick the encoder from the index they read, so this single
+        # assignment is the cutover
+        kb_index = index
+        EMBEDDING_MODEL = model_id
+        kb_changed()
+        save_json(ACTIVE_MODEL_FILE, {"model": model_id, "promoted_at": time.strftime("%Y-%m-%d %H:%M:%S")})
+    print(f"✅ Switched embedding model to {model_id}")
+    snapshot_after_write()
+    return model_id
+
+@app.route("/admin/reindex", methods=["GET"])
+def reindex_status():
+    require_admin()
+    return jsonify(dict(reindexer.status(), active_model=kb_index.model_id))
+
+@app.route("/admin/reindex", methods=["POST"])
+def reindex_start():
+    require_admin()
+    read_only = replica_read_only()
+    if read_only:
+        return read_only
+    payload = request.json or {}
+    model_id = (payload.get("model") or "").strip()
+    if not model_id:
+        return jsonify({"error": "No model provided"}), 400
+    if model_id == kb_index.model_id:
+        return jsonify({"error": f"{model_id} is already the active model"}), 400
+
+    # Models left over from earlier swaps are no longer referenced by any index
+    for stale in [m for m in embedders if m != kb_index.model_id]:
+        del embedders[stale]
+
+    on_ready = promote_candidate if payload.get("auto_promote") else None
+    if not reindexer.start(model_id, kb_docs, source_metadata(kb_docs), on_ready):
+        return jsonify({"error": "A re-index is already running"}), 409
+    return jsonify({"success": True, "model": model_id, "state": reindexer.state}), 202
+
+@app.route("/admin/reindex", methods=["DELETE"])
+def reindex_cancel():
+    require_admin()
+    if not reindexer.cancel():
+        return jsonify({"error": "The re-indexed model is being promoted"}), 409
+    return jsonify({"success": True, "state": reindexer.state}), 202
+
+@app.route("/admin/reindex/shadow", methods=["POST"])
+def reindex_shadow():
+    require_admin()
+    if reindexer.state != "ready":
+        return jsonify({"error": "Shadow scoring needs a ready re-indexed model"}), 409
+    reindexer.shadow_enabled = bool((request.json or {}).get("enabled", True))
+    return jsonify({"success": True, "shadow": reindexer.status()["shadow"]})
+
+@app.route("/admin/reindex/promote", methods=["POST"])
+def reindex_promote():
+    require_admin()
+    read_only = replica_read_only()
+    if read_only:
+        return read_only
+    try:
+        model_id = promote_candidate()
+    except RuntimeError as e:
+        return jsonify({"error": str(e)}), 409
+    return jsonify({"success": True, "active_model": model_id})
+
+# =========================
+# Snapshot Bundles
+# =========================
+@app.route("/admin/snapshot", methods=["POST"])
+def create_snapshot():
+    """Publish the live index as a new snapshot bundle for new nodes and replicas"""
+    require_admin()
+    read_only = replica_read_only()
+    if read_only:
+        return read_only
+    try:
+        manifest = publish_snapshot()
+    except SnapshotError as e:
+        return jsonify({"error": str(e)}), 409
+    except OSError as e:
+        return jsonify({"error": f"Failed to write snapshot: {str(e)}"}), 500
+    return jsonify({"success": True, "snapshot": manifest})
+
+def system_info_data():
+    return {
         "status": "online",
-        "kb_loaded": kb_embeddings is not None,
+        "kb_loaded": len(kb_index) > 0,
+        "embedding_model": kb_index.model_id,
         "total_documents": len(set(d.get("source") for d in kb_docs)) if kb_docs else 0,
         "total_chunks": len(kb_docs) if kb_docs else 0,
-        "version": "1.0.0"
-    })
+        "version": "1.0.0",
+        "role": "replica" if REPLICA_SNAPSHOT_DIR else "primary",
+        "snapshot_version": snapshot_version,
+        "load": dict(
+            admission.stats(),
+            degraded_mode=degraded_mode,
+            response_cache=response_cache.stats()
+        )
+    }
+
+# =========================
+# Load Shedding
+# =========================
+@app.route("/admin/degraded", methods=["POST"])
+def set_degraded_mode():
+    """Force /query to answer only from the intent router and response cache"""
+    global degraded_mode
+    require_admin()
+    degraded_mode = bool((request.json or {}).get("enabled", True))
+    return jsonify({"success": True, "degraded_mode": degraded_mode})
+
+@app.route("/api/system-info")
+def system_info():
+    """Public endpoint for system status"""
+    return jsonify(system_info_data())
+
+@app.route("/api/sources")
+def list_sources():
+    """List searchable sources with their upload date and tags (for /query filters)"""
+    return jsonify(kb_index.sources())
+
+EXAMPLE_QUESTIONS = [
+    {
+        "category": "Company Policies",
+        "questions": [
+            "What are the working hours?",
+            "Tell me about the leave policy",
+            "What is the remote work policy?"
+        ]
+    },
+    {
+        "category": "Office Information",
+        "questions": [
+            "Where are the office locations?",
+            "How many offices does Oudience have?"
+        ]
+    },
+    {
+        "category": "Workplace Culture",
+        "questions": [
+            "What are the company values?",
+            "Tell me about workplace culture",
+            "What is the code of conduct?"
+        ]
+    }
+]
 
 @app.route("/api/example-questions")
 def example_questions():
     """Provide example questions for users"""
-    examples = [
-        {
-            "category": "Company Policies",
-            "questions": [
-                "What are the working hours?",
-                "Tell me about the leave policy",
-                "What is the remote work policy?"
-            ]
-        },
-        {
-            "category": "Office Information",
-            "questions": [
-                "Where are the office locations?",
-                "How many offices does Oudience have?"
-            ]
-        },
-        {
-            "category": "Workplace Culture",
-            "questions": [
-                "What are the company values?",
-                "Tell me about workplace culture",
-                "What is the code of conduct?"
-            ]
-        }
-    ]
-    return jsonify(examples)
+    return jsonify(EXAMPLE_QUESTIONS)
 
 # =========================
 # Chat Endpoint (ENHANCED)
 # =========================
-@app.route("/query", methods=["POST"])
-def query():
-    q = (request.json or {}).get("query", "").strip()
+def parse_query_filters(raw):
+    """Validate the optional /query filters; raises ValueError on bad input"""
+    if not raw:
+        return {}
+    if not isinstance(raw, dict):
+        raise ValueError("filters must be an object")
+
+    filters = {}
+    source = raw.get("source")
+    if source:
+        filters["source"] = [source] if isinstance(source, str) else list(source)
+    if raw.get("uploaded_after"):
+        filters["uploaded_after"] = parse_date_bound(raw["uploaded_after"])
+    if raw.get("uploaded_before"):
+        filters["uploaded_before"] = parse_date_bound(raw["uploaded_before"], end_of_day=True)
+    tags = normalize_tags(raw.get("tags"))
+    if tags:
+        filters["tags"] = tags
+    return filters
+
+def route_query(payload):
+    """First, cheap stage of /query: validation and the intent router.
+
+    Returns (q, filters, index, generation, response); response is a
+    (body, status) pair when no knowledge base search is needed, otherwise
+    None.
+    """
+    q = payload.get("query", "").strip()
     if not q:
-        return jsonify({"response": "Please ask a question."})
+        return q, {}, None, None, ({"response": "Please ask a question."}, 200)
+
+    try:
+        filters = parse_query_filters(payload.get("filters"))
+    except (TypeError, ValueError):
+        return q, {}, None, None, ({"error": "Invalid filters. Use source, tags and uploaded_after/uploaded_before as YYYY-MM-DD"}, 400)
 
     # Check if it's a general conversational query first
     if is_general_query(q):
-        return jsonify({"response": generate_conversational_response(q)})
+        return q, filters, None, None, ({"response": generate_conversational_response(q)}, 200)
+
+    # Read the generation before the index: if a write lands in between, the
+    # answer is cached under the old generation and never served.
+    # The index is read once as a model cutover may swap it mid-request
+    generation = kb_generation
+    index = kb_index
 
     # If knowledge base is empty, provide conversational response
-    if kb_embeddings is None:
-        return jsonify({
+    if len(index) == 0:
+        return q, filters, index, generation, ({
             "response": "I don't have any specific documents loaded right now, but I'm still here to help! You can ask me general questions or about Oudience. What would you like to know?"
-        })
+        }, 200)
+
+    return q, filters, index, generation, None
 
+def search_knowledge_base(q, filters, index):
+    """CPU-bound stage of /query: embed, score and format; returns (body, status)"""
     # Perform semantic search in knowledge base
-    q_emb = embedder.encode(
+    started = time.perf_counter()
+    q_emb = embedders[index.model_id].encode(
         [q],
         convert_to_numpy=True,
         normalize_embeddings=True
     )[0]
 
-    scores = np.dot(kb_embeddings, q_emb)
+    # Filtered queries only score the matching source partitions
+    docs, scores = index.score(q_emb, filters)
+    if not docs:
+        return {
+            "response": "I couldn't find any documents matching the selected filters. Try widening the source, tag or date range."
+        }, 200
+    search_ms = (time.perf_counter() - started) * 1000
+    reindexer.shadow(q, filters, docs[int(np.argmax(scores))].get("id"), search_ms)
     
     # For policy questions, get multiple relevant chunks
     query_lower = q.lower()
@@ -735,13 +1033,13 @@ def query():
         
         for idx in top_indices:
             if scores[idx] >= 0.25:  # Lower threshold for policy queries
-                relevant_chunks.append(kb_docs[idx]["text"])
+                relevant_chunks.append(docs[idx]["text"])
         
         if relevant_chunks:
             # Combine chunks for comprehensive policy response
             combined_text = " ".join(relevant_chunks)
             focused_response = generate_focused_response(q, combined_text)
-            return jsonify({"response": focused_response})
+            return {"response": focused_response}, 200
     
     # Regular single-chunk search for non-policy queries
     best_idx = int(np.argmax(scores))
@@ -749,10 +1047,10 @@ def query():
 
     # If similarity is high enough, return knowledge base result
     if best_score >= 0.35:
-        focused_response = generate_focused_response(q, kb_docs[best_idx]["text"])
-        return jsonify({
+        focused_response = generate_focused_response(q, docs[best_idx]["text"])
+        return {
             "response": focused_response
-        })
+        }, 200
     
     # If no relevant knowledge base info, try conversational response
     # But first check if query seems to be asking for specific information
@@ -761,13 +1059,60 @@ def query():
         # This seems like an information-seeking query, so mention knowledge base limitation
         conversational_response = generate_conversational_response(q)
         if "interesting question" in conversational_response:  # Default response
-            return jsonify({
+            return {
                 "response": f"I don't have specific information about that in my knowledge base, but I'm happy to help in other ways! You could try asking about Oudience policies, procedures, or general questions. What else would you like to know?"
-            })
-        return jsonify({"response": conversational_response})
+            }, 200
+        return {"response": conversational_response}, 200
     else:
         # Handle as general conversation
-        return jsonify({"response": generate_conversational_response(q)})
+        return {"response": generate_conversational_response(q)}, 200
+
+def overloaded_response():
+    # "response" so the chat UI shows the message like any other answer
+    return {
+        "response": "I'm receiving a lot of questions right now. Please try again in a moment.",
+        "degraded": True
+    }, 503
+
+def cache_key(q, filters, index, generation):
+    return q.lower(), repr(sorted(filters.items())), index.model_id, generation
+
+def cached_response(q, filters, index, generation):
+    """Answer from the response cache, or refuse outright in degraded mode.
+
+    Returns None when the query needs an admitted search.
+    """
+    cached = response_cache.get(cache_key(q, filters, index, generation))
+    if cached is not None:
+        return cached, 200
+    if degraded_mode:
+        admission.record_shed("query")
+        return overloaded_response()
+    return None
+
+def admitted_search(q, filters, index, generation):
+    """Run the search stage behind admission control; sheds with a 503"""
+    try:
+        with admission.admit("query"):
+            body, status = search_knowledge_base(q, filters, index)
+    except Overloaded:
+        return overloaded_response()
+    if status == 200:
+        response_cache.put(cache_key(q, filters, index, generation), body)
+    return body, status
+
+def response_headers(status):
+    return {"Retry-After": str(RETRY_AFTER_S)} if status == 503 else {}
+
+@app.route("/query", methods=["POST"])
+def query():
+    q, filters, index, generation, response = route_query(request.json or {})
+    if response is None:
+        response = cached_response(q, filters, index, generation)
+    if response is None:
+        response = admitted_search(q, filters, index, generation)
+    body, status = response
+    return jsonify(body), status, response_headers(status)
 
 # =========================
 # Frontend
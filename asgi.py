@@ -0,0 +1,106 @@
+"""ASGI entry point serving the same routes as app.py.
+
+    uvicorn asgi:app --host 0.0.0.0 --port 5002
+
+/query, the public /api/* endpoints and static files are served directly
+on the event loop, so idle keep-alive connections cost no thread. The
+CPU-bound search stage (embedder.encode + NumPy scoring) runs on a
+bounded thread pool behind the same admission control as app.py. Admin
+routes are delegated to the Flask app so session-based auth behaves
+exactly as under waitress.
+"""
+import os
+import asyncio
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
+
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.responses import FileResponse, JSONResponse
+from starlette.routing import Mount, Route
+from starlette.staticfiles import StaticFiles
+
+import app as flask_app
+
+# Threads for embedding and scoring; torch and NumPy release the GIL while computing.
+# Admission control caps the running searches, so the pool only needs room
+# for those plus the bounded wait queue.
+SEARCH_WORKERS = int(os.getenv(
+    "ASGI_SEARCH_WORKERS", flask_app.QUERY_CONCURRENCY + flask_app.QUERY_QUEUE_SIZE
+))
+# Threads for the delegated Flask (admin) routes
+ADMIN_WORKERS = int(os.getenv("ASGI_ADMIN_WORKERS", 4))
+
+search_pool = ThreadPoolExecutor(max_workers=SEARCH_WORKERS, thread_name_prefix="search")
+
+# =========================
+# Chat Endpoint
+# =========================
+async def query(request):
+    try:
+        payload = await request.json()
+    except ValueError:
+        payload = {}
+    if not isinstance(payload, dict):
+        payload = {}
+
+    q, filters, index, generation, response = flask_app.route_query(payload)
+    if response is None:
+        response = flask_app.cached_response(q, filters, index, generation)
+    if response is None:
+        if flask_app.admission.is_saturated("query"):
+            # Shed on the event loop rather than queueing on the pool
+            response = flask_app.overloaded_response()
+            flask_app.admission.record_shed("query")
+        else:
+            loop = asyncio.get_running_loop()
+            response = await loop.run_in_executor(
+                search_pool, flask_app.admitted_search, q, filters, index, generation
+            )
+    body, status = response
+    return JSONResponse(body, status_code=status, headers=flask_app.response_headers(status))
+
+# =========================
+# Public API
+# =========================
+async def system_info(request):
+    return JSONResponse(flask_app.system_info_data())
+
+async def list_sources(request):
+    return JSONResponse(flask_app.kb_index.sources())
+
+async def example_questions(request):
+    return JSONResponse(flask_app.EXAMPLE_QUESTIONS)
+
+# =========================
+# Frontend
+# =========================
+def static_page(filename):
+    path = os.path.join("static", filename)
+
+    async def page(request):
+        return FileResponse(path)
+    return page
+
+# Everything else under /admin (login, upload, reindex, ...) runs in Flask
+admin_wsgi = WSGIMiddleware(flask_app.app, workers=ADMIN_WORKERS)
+
+routes = [
+    Route("/query", query, methods=["POST"]),
+    Route("/api/system-info", system_info),
+    Route("/api/sources", list_sources),
+    Route("/api/example-questions", example_questions),
+    Route("/", static_page("index_enhanced.html")),
+    Route("/classic", static_page("index.html")),
+    Route("/admin", static_page("admin_enhanced.html")),
+    Route("/admin/classic", static_page("admin.html")),
+    Route("/admin/{path:path}", admin_wsgi, methods=["GET", "POST", "DELETE"]),
+    Mount("/", StaticFiles(directory="static")),
+]
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    yield
+    search_pool.shutdown(wait=False)
+
+app = Starlette(routes=routes, lifespan=lifespan)
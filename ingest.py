@@ -0,0 +1,330 @@
+"""Offline bulk ingestion for the knowledge base.
+
+Walks a directory of PDF, txt and markdown files, extracts them in
+parallel, embeds every chunk in large batches and writes the knowledge
+base and embedding store once at the end. An interrupted run picks up
+where it stopped from the checkpoint in --state-dir.
+
+    python ingest.py path/to/docs --tags handbook,hr --workers 8
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+from werkzeug.utils import secure_filename
+
+from knowledge_base import (
+    load_json, save_json, chunk_text, chunk_paragraphs, extract_pdf_text,
+    load_embedding_store, save_embedding_store, text_key, normalize_tags,
+    configured_model, UPLOAD_DIR, KB_FILE, UPLOAD_LOGS, EMBEDDINGS_DIR, CHUNK_SIZE
+)
+
+SUPPORTED_EXTENSIONS = (".pdf", ".txt", ".md", ".markdown")
+STATE_DIR = ".ingest_state"
+
+# =========================
+# Extraction (runs in worker processes)
+# =========================
+def find_documents(root):
+    """All supported files under root, in a stable order"""
+    paths = []
+    for dirpath, _, filenames in os.walk(root):
+        for name in filenames:
+            if name.lower().endswith(SUPPORTED_EXTENSIONS):
+                paths.append(os.path.join(dirpath, name))
+    return sorted(paths)
+
+def fingerprint(path):
+    stat = os.stat(path)
+    return {"file_size": stat.st_size, "mtime": stat.st_mtime}
+
+def extract_document(path, root, chunk_size):
+    """Extract and chunk one file; returns a JSON-serialisable record"""
+    rel_path = os.path.relpath(path, root)
+    if path.lower().endswith(".pdf"):
+        text, pages = extract_pdf_text(path)
+        chunks = chunk_text(text, chunk_size)
+    else:
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            text = f.read()
+        pages = None
+        chunks = chunk_paragraphs(text, chunk_size)
+
+    return dict(
+        fingerprint(path),
+        path=rel_path,
+        source=secure_filename(rel_path),
+        pages=pages,
+        chunks=[c.strip() for c in chunks if c.strip()]
+    )
+
+# =========================
+# Checkpoint State
+# =========================
+def prepare_state(args):
+    """Discard a checkpoint built with another model or chunk size, then record ours"""
+    settings = {"model": args.model, "chunk_size": args.chunk_size}
+    path = os.path.join(args.state_dir, "settings.json")
+    if os.path.isdir(args.state_dir) and load_json(path) != settings:
+        print(f"ℹ️ Discarding checkpoint in {args.state_dir}: it was made with different --model/--chunk-size")
+        shutil.rmtree(args.state_dir)
+    os.makedirs(args.state_dir, exist_ok=True)
+    save_json(path, settings)
+
+def load_extracted(state_dir):
+    """Records of files extracted by a previous (interrupted) run"""
+    records = {}
+    path = os.path.join(state_dir, "extracted.jsonl")
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # Torn last line from an interrupted write
+                records[record["path"]] = record
+    return records
+
+def load_embedded(state_dir):
+    """Embeddings checkpointed by a previous run, keyed by text hash"""
+    vectors = {}
+    parts_dir = os.path.join(state_dir, "embeddings")
+    if not os.path.isdir(parts_dir):
+        return vectors
+    for name in sorted(os.listdir(parts_dir)):
+        if not name.endswith(".json"):
+            continue
+        matrix_path = os.path.join(parts_dir, name[:-5] + ".npy")
+        try:
+            keys = load_json(os.path.join(parts_dir, name))
+            matrix = np.load(matrix_path)
+        except (OSError, ValueError):
+            continue
+        vectors.update(zip(keys, matrix))
+    return vectors
+
+def save_embedded_part(state_dir, part, keys, matrix):
+    parts_dir = os.path.join(state_dir, "embeddings")
+    os.makedirs(parts_dir, exist_ok=True)
+    base = os.path.join(parts_dir, f"part-{part:05d}")
+    np.save(base + ".npy", matrix)
+    # Keys are written last: a part only counts once both files exist
+    save_json(base + ".json", keys)
+
+# =========================
+# Pipeline
+# =========================
+def extract_all(paths, root, args):
+    """Extract every changed file in parallel, checkpointing each result"""
+    done = load_extracted(args.state_dir)
+    todo = []
+    for path in paths:
+        record = done.get(os.path.relpath(path, root))
+        if record is None or {k: record.get(k) for k in ("file_size", "mtime")} != fingerprint(path):
+            todo.append(path)
+
+    print(f"📂 Found {len(paths)} documents ({len(paths) - len(todo)} already extracted)")
+    if not todo:
+        return done
+
+    os.makedirs(args.state_dir, exist_ok=True)
+    started = time.time()
+    failed = 0
+    with ProcessPoolExecutor(max_workers=args.workers) as pool, \
+            open(os.path.join(args.state_dir, "extracted.jsonl"), "a", encoding="utf-8") as log:
+        futures = {pool.submit(extract_document, path, root, args.chunk_size): path for path in todo}
+        for n, future in enumerate(as_completed(futures), 1):
+            path = futures[future]
+            try:
+                record = future.result()
+            except Exception as e:
+                failed += 1
+                print(f"❌ [{n}/{len(todo)}] {path}: {str(e)}")
+                continue
+            log.write(json.dumps(record) + "\n")
+            log.flush()
+            done[record["path"]] = record
+            rate = n / max(time.time() - started, 1e-9)
+            print(f"📄 [{n}/{len(todo)}] {record['path']}: {len(record['chunks'])} chunks ({rate:.1f} files/s)")
+
+    elapsed = time.time() - started
+    print(f"✅ Extracted {len(todo) - failed} files in {elapsed:.1f}s ({failed} failed)")
+    return done
+
+def embed_all(texts, args):
+    """Embeddings for texts, reusing the store and checkpoint where possible"""
+    vectors = load_embedded(args.state_dir)
+    stored_rows, stored = load_embedding_store(args.embeddings_dir, args.model)
+
+    pending = []
+    seen = set()
+    for text in texts:
+        key = text_key(text)
+        if key in vectors or key in seen:
+            continue
+        if key in stored_rows:
+            vectors[key] = stored[stored_rows[key]]
+            continue
+        seen.add(key)
+        pending.append(text)
+
+    print(f"🔄 {len(texts)} chunks, {len(pending)} need embedding")
+    if pending:
+        # Imported late so --help and extraction-only failures stay fast
+        from sentence_transformers import SentenceTransformer
+        model = SentenceTransformer(args.model)
+
+        parts_dir = os.path.join(args.state_dir, "embeddings")
+        part = len([n for n in os.listdir(parts_dir) if n.endswith(".json")]) if os.path.isdir(parts_dir) else 0
+        started = time.time()
+        for i in range(0, len(pending), args.batch_size):
+            batch = pending[i:i + args.batch_size]
+            matrix = model.encode(
+                batch,
+                batch_size=args.encode_batch_size,
+                convert_to_numpy=True,
+                normalize_embeddings=True,
+                show_progress_bar=False
+            )
+            keys = [text_key(t) for t in batch]
+            save_embedded_part(args.state_dir, part, keys, matrix)
+            part += 1
+            vectors.update(zip(keys, matrix))
+
+            embedded = i + len(batch)
+            rate = embedded / max(time.time() - started, 1e-9)
+            print(f"🧠 Embedded {embedded}/{len(pending)} chunks ({rate:.0f} chunks/s)")
+
+    return np.vstack([vectors[text_key(t)] for t in texts]) if texts else None
+
+def dedupe_sources(records):
+    """Give records whose flattened paths collide (hr/policy.pdf, hr_policy.pdf) unique sources.
+
+    Records are in path order, so the first keeps its name and re-running
+    the same ingest assigns the same suffixes.
+    """
+    taken = {r["source"] for r in records}
+    seen = set()
+    for record in records:
+        if record["source"] not in seen:
+            seen.add(record["source"])
+            continue
+        stem, ext = os.path.splitext(record["source"])
+        n = 2
+        while f"{stem}-{n}{ext}" in taken:
+            n += 1
+        source = f"{stem}-{n}{ext}"
+        print(f"⚠️ {record['path']} has the same name as another file; ingesting it as {source}")
+        record["source"] = source
+        taken.add(source)
+        seen.add(source)
+    return records
+
+def build_kb(records, args):
+    """Merge ingested records into the existing KB; same-named sources are replaced"""
+    uploaded_at = time.strftime("%Y-%m-%d %H:%M:%S")
+    tags = normalize_tags(args.tags)
+    sources = {r["source"] for r in records}
+
+    kb_docs = [d for d in load_json(args.kb_file) if d.get("source") not in sources]
+    next_id = max([d.get("id", 0) for d in kb_docs], default=0) + 1
+    logs = [log for log in load_json(args.upload_logs) if log.get("filename") not in sources]
+
+    for record in records:
+        for chunk in record["chunks"]:
+            kb_docs.append({
+                "id": next_id,
+                "source": record["source"],
+                "text": chunk,
+                "page_info": f"{record['pages']} pages" if record["pages"] else "Text document",
+                "uploaded_at": uploaded_at,
+                "tags": tags
+            })
+            next_id += 1
+        logs.append({
+            "filename": record["source"],
+            "original_filename": record["path"],
+            "chunks": len(record["chunks"]),
+            "file_size": record["file_size"],
+            "file_size_mb": round(record["file_size"] / (1024 * 1024), 2),
+            "pages": record["pages"] or 0,
+            "tags": tags,
+            "uploaded_at": uploaded_at
+        })
+    return kb_docs, logs
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk-ingest PDF, txt and markdown files into the knowledge base.")
+    parser.add_argument("directory", help="Directory to scan recursively")
+    parser.add_argument("--tags", default="", help="Comma-separated tags applied to every ingested document")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Parallel extraction processes")
+    parser.add_argument("--batch-size", type=int, default=1024, help="Chunks per embedding batch / checkpoint")
+    parser.add_argument("--encode-batch-size", type=int, default=64, help="Batch size passed to the encoder")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="Words per chunk")
+    parser.add_argument("--model", default=configured_model(), help="SentenceTransformer model name (default: the active model)")
+    parser.add_argument("--kb-file", default=KB_FILE)
+    parser.add_argument("--upload-logs", default=UPLOAD_LOGS)
+    parser.add_argument("--embeddings-dir", default=EMBEDDINGS_DIR)
+    parser.add_argument("--upload-dir", default=UPLOAD_DIR)
+    parser.add_argument("--state-dir", default=STATE_DIR, help="Checkpoint directory for resuming")
+    parser.add_argument("--no-copy", action="store_true", help="Don't copy source files into the upload directory")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    if not os.path.isdir(args.directory):
+        print(f"❌ Not a directory: {args.directory}")
+        return 1
+
+    started = time.time()
+    root = os.path.abspath(args.directory)
+    paths = find_documents(root)
+    prepare_state(args)
+    extracted = extract_all(paths, root, args)
+
+    # Only files still present in the directory, in path order
+    records = []
+    for path in paths:
+        record = extracted.get(os.path.relpath(path, root))
+        if record is None:
+            continue
+        if not record["chunks"]:
+            print(f"⚠️ Skipping {record['path']}: no usable text")
+            continue
+        records.append(record)
+
+    if not records:
+        print("ℹ️ Nothing to ingest")
+        return 0
+
+    records = dedupe_sources(records)
+    kb_docs, logs = build_kb(records, args)
+    texts = [d["text"] for d in kb_docs]
+    embeddings = embed_all(texts, args)
+
+    # Single write of everything at the end
+    save_json(args.kb_file, kb_docs)
+    save_embedding_store(args.embeddings_dir, args.model, texts, embeddings)
+    save_json(args.upload_logs, logs)
+
+    if not args.no_copy:
+        os.makedirs(args.upload_dir, exist_ok=True)
+        for record in records:
+            shutil.copy2(os.path.join(root, record["path"]), os.path.join(args.upload_dir, record["source"]))
+
+    shutil.rmtree(args.state_dir, ignore_errors=True)
+
+    elapsed = time.time() - started
+    new_chunks = sum(len(r["chunks"]) for r in records)
+    print(f"✅ Ingested {len(records)} documents / {new_chunks} chunks in {elapsed:.1f}s "
+          f"({len(records) / max(elapsed, 1e-9):.1f} docs/s, {new_chunks / max(elapsed, 1e-9):.0f} chunks/s)")
+    print(f"📚 Knowledge base now has {len(kb_docs)} chunks")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,401 @@
+import os
+import re
+import json
+import hashlib
+import threading
+from datetime import datetime, timedelta
+
+import numpy as np
+import pdfplumber
+
+# =========================
+# Storage Constants
+# =========================
+# Shared by the Flask app and the offline tools (ingest.py)
+UPLOAD_DIR = "uploads_exp"
+KB_FILE = "knowledge_base_exp.json"
+UPLOAD_LOGS = "upload_logs.json"
+EMBEDDINGS_DIR = "embeddings_exp"
+DEFAULT_EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+ACTIVE_MODEL_FILE = os.path.join(EMBEDDINGS_DIR, "active_model.json")
+CHUNK_SIZE = 250
+MIN_CHUNK_WORDS = 30
+
+# =========================
+# Helpers
+# =========================
+def load_json(path):
+    if not os.path.exists(path):
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def save_json(path, data):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2)
+
+def configured_model():
+    """EMBEDDING_MODEL (env), else the last promoted model, else the default"""
+    active = load_json(ACTIVE_MODEL_FILE)
+    promoted = active.get("model") if isinstance(active, dict) else None
+    return os.getenv("EMBEDDING_MODEL") or promoted or DEFAULT_EMBEDDING_MODEL
+
+def chunk_text(text, size=250):
+    """Split text into chunks with improved memory efficiency"""
+    words = text.split()
+    chunks = []
+    for i in range(0, len(words), size):
+        chunk = " ".join(words[i:i + size])
+        if len(words[i:i + size]) > 30:
+            chunks.append(chunk)
+    return chunks
+
+def chunk_paragraphs(text, size=250, min_words=MIN_CHUNK_WORDS):
+    """Chunk plain text / markdown on blank lines.
+
+    Short paragraphs (FAQ entries, headings) are merged until a chunk has
+    at least min_words words; paragraphs longer than size are split.
+    """
+    chunks = []
+    current = []
+    for block in re.split(r"\n\s*\n", text):
+        words = block.split()
+        if not words:
+            continue
+        for i in range(0, len(words), size):
+            current.extend(words[i:i + size])
+            if len(current) >= min_words:
+                chunks.append(" ".join(current))
+                current = []
+    if current:
+        chunks.append(" ".join(current))
+    return chunks
+
+def extract_pdf_text(path):
+    """Extract text from a PDF with page markers; returns (text, page_count)"""
+    text = ""
+    with pdfplumber.open(path) as pdf:
+        page_count = len(pdf.pages)
+
+        # Warn if very large PDF
+        if page_count > 100:
+            print(f"⚠️ Large PDF detected: {page_count} pages")
+
+        for page_num, page in enumerate(pdf.pages):
+            page_text = page.extract_text()
+            if page_text:
+                text += f"[Page {page_num + 1}] {page_text}\n"
+    return text, page_count
+
+# =========================
+# Embedding Store
+# =========================
+# Embeddings are persisted per model and keyed by a hash of the chunk text,
+# so a restart only embeds chunks that are new or changed.
+
+def text_key(text):
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+def _store_paths(directory, model_name):
+    slug = re.sub(r"[^A-Za-z0-9_.-]+", "_", model_name)
+    return os.path.join(directory, f"{slug}.npy"), os.path.join(directory, f"{slug}.json")
+
+def save_embedding_store(directory, model_name, texts, embeddings):
+    """Write embeddings for texts (same row order), replacing any previous store"""
+    os.makedirs(directory, exist_ok=True)
+    matrix_path, meta_path = _store_paths(directory, model_name)
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+
+    # Write to temp files first so a crash never leaves a half-written store
+    with open(matrix_path + ".tmp", "wb") as f:
+        np.save(f, embeddings)
+    save_json(meta_path + ".tmp", {
+        "model": model_name,
+        "count": len(texts),
+        "dim": int(embeddings.shape[1]) if embeddings.ndim == 2 else 0,
+        "keys": [text_key(t) for t in texts]
+    })
+    os.replace(matrix_path + ".tmp", matrix_path)
+    os.replace(meta_path + ".tmp", meta_path)
+
+def load_embedding_store(directory, model_name):
+    """Return {text_key: row} and the matrix, or ({}, None) if missing/corrupt"""
+    matrix_path, meta_path = _store_paths(directory, model_name)
+    if not (os.path.exists(matrix_path) and os.path.exists(meta_path)):
+        return {}, None
+    try:
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        matrix = np.load(matrix_path)
+    except (OSError, ValueError):
+        return {}, None
+    if meta.get("model") != model_name or len(meta.get("keys", [])) != len(matrix):
+        return {}, None
+    return {key: row for row, key in enumerate(meta["keys"])}, matrix
+
+# =========================
+# Partitioned Embedding Index
+# =========================
+# Rows of the embedding matrix are grouped by document source so every
+# source owns one contiguous row range. Filtered searches only score the
+# ranges they need, and deleting a source just drops its range from the
+# partition table and clears it in the live-row mask.
+
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+COMPACT_DEAD_FRACTION = 0.25  # Compact on delete once this share of rows is dead
+
+def parse_date_bound(value, end_of_day=False):
+    """Normalise a "YYYY-MM-DD" or "YYYY-MM-DD HH:MM:SS" filter value.
+
+    Date-only upper bounds cover the whole day. Raises ValueError for
+    anything else.
+    """
+    value = str(value).strip()
+    try:
+        return datetime.strptime(value, DATE_FORMAT).strftime(DATE_FORMAT)
+    except ValueError:
+        day = datetime.strptime(value, "%Y-%m-%d")
+        if end_of_day:
+            day += timedelta(days=1, seconds=-1)
+        return day.strftime(DATE_FORMAT)
+
+def normalize_tags(tags):
+    """Accept a list or a comma-separated string and return clean lowercase tags"""
+    if not tags:
+        return []
+    if isinstance(tags, str):
+        tags = tags.split(",")
+    return sorted({str(t).strip().lower() for t in tags if str(t).strip()})
+
+def source_metadata(docs, upload_logs=UPLOAD_LOGS):
+    """Collect per-source upload date and tags for the partitioned index"""
+    logged = {log.get("filename"): log for log in load_json(upload_logs)}
+    meta = {}
+    for d in docs:
+        source = d.get("source")
+        if source in meta:
+            continue
+        log = logged.get(source, {})
+        meta[source] = {
+            "uploaded_at": d.get("uploaded_at") or log.get("uploaded_at"),
+            "tags": d.get("tags") or log.get("tags", [])
+        }
+    return meta
+
+class PartitionedIndex:
+    """Normalised embedding matrix with one contiguous row range per source.
+
+    model_id records which embedding model produced the matrix; queries
+    must be encoded with the same model.
+    """
+
+    def __init__(self, model_id=None):
+        self.model_id = model_id
+        # (docs, embeddings, live mask, partitions) is swapped as a single
+        # reference so concurrent readers never see a mix of two layouts
+        self._view = ([], None, np.zeros(0, dtype=bool), {})
+        self._lock = threading.Lock()
+
+    @classmethod
+    def build(cls, docs, embeddings, meta=None, model_id=None):
+        """Build an index from docs and their embeddings (same row order).
+
+        meta maps source -> {"uploaded_at": ..., "tags": [...]}.
+        """
+        meta = meta or {}
+        index = cls(model_id)
+        if not docs:
+            return index
+
+        # Stable sort keeps chunk order inside each source
+        order = sorted(range(len(docs)), key=lambda i: str(docs[i].get("source", "")))
+        sorted_docs = [docs[i] for i in order]
+        matrix = np.asarray(embeddings)[order]
+
+        partitions = {}
+        start = 0
+        for row in range(1, len(order) + 1):
+            if row == len(order) or sorted_docs[row].get("source") != sorted_docs[start].get("source"):
+                source = sorted_docs[start].get("source")
+                partitions[source] = cls._partition(start, row, meta.get(source))
+                start = row
+
+        index._view = (sorted_docs, matrix, np.ones(len(order), dtype=bool), partitions)
+        return index
+
+    @classmethod
+    def from_parts(cls, docs, embeddings, partitions, model_id=None):
+        """Rebuild an index exported by export() without copying the matrix.
+
+        embeddings may be a read-only memory map.
+        """
+        index = cls(model_id)
+        if docs:
+            index._view = (list(docs), embeddings, np.ones(len(docs), dtype=bool), dict(partitions))
+        return index
+
+    def export(self):
+        """Compacted (docs, embeddings, partitions) with dropped rows removed"""
+        docs, embeddings, live, partitions = self._view
+        if embeddings is None or live.all():
+            return list(docs), embeddings, dict(partitions)
+        return self._compact(docs, embeddings, partitions)
+
+    @staticmethod
+    def _compact(docs, embeddings, partitions):
+        """Copy only the rows of the given partitions into a fresh layout"""
+        new_docs, blocks, new_partitions = [], [], {}
+        row = 0
+        for name, part in sorted(partitions.items(), key=lambda p: p[1]["start"]):
+            size = part["stop"] - part["start"]
+            new_docs.extend(docs[part["start"]:part["stop"]])
+            blocks.append(embeddings[part["start"]:part["stop"]])
+            new_partitions[name] = dict(part, start=row, stop=row + size)
+            row += size
+        return new_docs, (np.vstack(blocks) if blocks else None), new_partitions
+
+    @staticmethod
+    def _partition(start, stop, meta):
+        meta = meta or {}
+        return {
+            "start": start,
+            "stop": stop,
+            "uploaded_at": meta.get("uploaded_at"),
+            "tags": normalize_tags(meta.get("tags")),
+        }
+
+    def __len__(self):
+        return int(self._view[2].sum())
+
+    @property
+    def dim(self):
+        embeddings = self._view[1]
+        return None if embeddings is None else embeddings.shape[1]
+
+    def live_docs(self):
+        """Docs of every live row, in row order"""
+        docs, _, live, _ = self._view
+        return [doc for doc, alive in zip(docs, live) if alive]
+
+    def live_matrix(self):
+        """(docs, embeddings) of every live row, e.g. for persisting"""
+        docs, embeddings, live, _ = self._view
+        if embeddings is None:
+            return [], None
+        if live.all():
+            return list(docs), embeddings
+        return [doc for doc, alive in zip(docs, live) if alive], embeddings[live]
+
+    def add_partition(self, source, docs, embeddings, meta=None):
+        """Append (or replace) a source's rows without re-embedding the rest.
+
+        Dropped rows are compacted away while the new matrix is assembled.
+        """
+        embeddings = np.asarray(embeddings)
+        with self._lock:
+            old_docs, old_embeddings, _, old_partitions = self._view
+            new_docs, blocks, partitions = [], [], {}
+            row = 0
+            for name, part in old_partitions.items():
+                if name == source:
+                    continue
+                size = part["stop"] - part["start"]
+                new_docs.extend(old_docs[part["start"]:part["stop"]])
+                blocks.append(old_embeddings[part["start"]:part["stop"]])
+                partitions[name] = dict(part, start=row, stop=row + size)
+                row += size
+
+            if docs:
+                new_docs.extend(docs)
+                blocks.append(embeddings)
+                partitions[source] = self._partition(row, row + len(docs), meta)
+
+            matrix = np.vstack(blocks) if blocks else None
+            self._view = (new_docs, matrix, np.ones(len(new_docs), dtype=bool), partitions)
+
+    def drop_partition(self, source):
+        """Remove a source without re-embedding: forget its range and mask its rows.
+
+        Masked rows are still multiplied by unfiltered queries, so once more
+        than COMPACT_DEAD_FRACTION of the matrix is dead the live rows are
+        copied into a compact matrix. Returns the number of rows dropped.
+        """
+        with self._lock:
+            docs, embeddings, live, partitions = self._view
+            part = partitions.get(source)
+            if part is None:
+                return 0
+            partitions = {name: p for name, p in partitions.items() if name != source}
+            # Readers may hold the published mask, so change a copy
+            live = live.copy()
+            live[part["start"]:part["stop"]] = False
+            if live.size and 1 - live.mean() > COMPACT_DEAD_FRACTION:
+                docs, embeddings, partitions = self._compact(docs, embeddings, partitions)
+                live = np.ones(len(docs), dtype=bool)
+            self._view = (docs, embeddings, live, partitions)
+            return part["stop"] - part["start"]
+
+    def sources(self):
+        """Per-source summary for listing and filter UIs"""
+        return [
+            {
+                "source": name,
+                "chunks": part["stop"] - part["start"],
+                "uploaded_at": part["uploaded_at"],
+                "tags": part["tags"],
+            }
+            for name, part in sorted(self._view[3].items(), key=lambda p: str(p[0]))
+        ]
+
+    @staticmethod
+    def _select(partitions, source=None, uploaded_after=None, uploaded_before=None, tags=None):
+        """Row ranges of the partitions matching every given filter"""
+        if isinstance(source, str):
+            source = [source]
+        wanted_sources = set(source) if source else None
+        wanted_tags = set(normalize_tags(tags))
+
+        ranges = []
+        for name, part in partitions.items():
+            if wanted_sources is not None and name not in wanted_sources:
+                continue
+            if uploaded_after or uploaded_before:
+                uploaded_at = part["uploaded_at"]
+                if not uploaded_at:
+                    continue
+                if uploaded_after and uploaded_at < uploaded_after:
+                    continue
+                if uploaded_before and uploaded_at > uploaded_before:
+                    continue
+            if wanted_tags and not wanted_tags.intersection(part["tags"]):
+                continue
+            ranges.append((part["start"], part["stop"]))
+        return sorted(ranges)
+
+    def score(self, q_emb, filters=None):
+        """Cosine scores for q_emb against live rows matching filters.
+
+        filters may hold source, uploaded_after, uploaded_before and tags
+        (see _select). Returns (docs, scores) with scores[i] for docs[i].
+        """
+        docs, embeddings, live, partitions = self._view
+        if embeddings is None or not docs:
+            return [], np.zeros(0, dtype=np.float32)
+
+        if not filters or not any(filters.values()):
+            scores = np.dot(embeddings, q_emb)
+            if not live.all():
+                # Rows of dropped partitions linger until the next compaction
+                scores[~live] = -np.inf
+            return docs, scores
+
+        ranges = self._select(partitions, **filters)
+        if not ranges:
+            return [], np.zeros(0, dtype=np.float32)
+
+        # Partitions are contiguous, so each range is a cheap slice
+        scores = np.concatenate([
+            np.dot(embeddings[start:stop], q_emb) for start, stop in ranges
+        ])
+        matched = [doc for start, stop in ranges for doc in docs[start:stop]]
+        return matched, scores
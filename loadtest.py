@@ -0,0 +1,134 @@
+"""Compare /query throughput between running servers.
+
+Start the servers first, e.g. waitress on 5002 and the ASGI app on 5003:
+
+    waitress-serve --threads 4 --port 5002 app:app
+    uvicorn asgi:app --port 5003
+
+    python loadtest.py --target waitress=http://localhost:5002 \
+                       --target asgi=http://localhost:5003 \
+                       --concurrency 32 --duration 30 --idle 500
+
+Each worker keeps one keep-alive connection open and posts queries back
+to back; --idle opens extra connections that stay silent during the run.
+"""
+import sys
+import json
+import time
+import socket
+import argparse
+import threading
+import http.client
+from urllib.parse import urlparse
+
+QUERIES = [
+    "What are the working hours?",
+    "Tell me about the leave policy",
+    "What is the remote work policy?",
+    "Where are the office locations?",
+    "What are the company values?",
+    "What is the code of conduct?",
+]
+
+def worker(url, deadline, latencies, errors, lock, offset):
+    conn = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=30)
+    n = offset
+    while time.time() < deadline:
+        body = json.dumps({"query": QUERIES[n % len(QUERIES)]})
+        n += 1
+        started = time.perf_counter()
+        try:
+            conn.request("POST", "/query", body, {"Content-Type": "application/json"})
+            response = conn.getresponse()
+            response.read()
+            ok = response.status == 200
+        except (OSError, http.client.HTTPException):
+            ok = False
+            conn.close()
+            conn = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=30)
+        elapsed = time.perf_counter() - started
+        with lock:
+            if ok:
+                latencies.append(elapsed)
+            else:
+                errors.append(elapsed)
+    conn.close()
+
+def open_idle_connections(url, count):
+    """Connections that complete one request and then sit idle (keep-alive)"""
+    sockets = []
+    for _ in range(count):
+        try:
+            sock = socket.create_connection((url.hostname, url.port or 80), timeout=10)
+            sock.sendall(
+                f"GET /api/system-info HTTP/1.1\r\nHost: {url.hostname}\r\nConnection: keep-alive\r\n\r\n".encode()
+            )
+            sock.recv(65536)
+            sockets.append(sock)
+        except OSError:
+            break
+    return sockets
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+def run(name, base_url, args):
+    url = urlparse(base_url)
+    idle = open_idle_connections(url, args.idle)
+
+    latencies, errors, lock = [], [], threading.Lock()
+    started = time.time()
+    deadline = started + args.duration
+    threads = [
+        threading.Thread(target=worker, args=(url, deadline, latencies, errors, lock, i))
+        for i in range(args.concurrency)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.time() - started
+
+    for sock in idle:
+        sock.close()
+
+    return {
+        "target": name,
+        "idle_held": len(idle),
+        "requests": len(latencies),
+        "errors": len(errors),
+        "rps": len(latencies) / elapsed,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Side-by-side /query load test")
+    parser.add_argument("--target", action="append", required=True,
+                        help="name=url of a running server; repeat to compare")
+    parser.add_argument("--concurrency", type=int, default=16, help="Active keep-alive clients")
+    parser.add_argument("--duration", type=float, default=20, help="Seconds per target")
+    parser.add_argument("--idle", type=int, default=0, help="Extra idle keep-alive connections held open")
+    args = parser.parse_args(argv)
+
+    results = []
+    for target in args.target:
+        name, _, base_url = target.partition("=")
+        if not base_url:
+            name, base_url = target, target
+        print(f"🔄 {name}: {args.concurrency} clients, {args.idle} idle connections, {args.duration:.0f}s")
+        results.append(run(name, base_url, args))
+
+    print()
+    print(f"{'target':<12}{'idle held':>10}{'requests':>10}{'errors':>8}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+    for r in results:
+        print(f"{r['target']:<12}{r['idle_held']:>10}{r['requests']:>10}{r['errors']:>8}{r['rps']:>9.1f}"
+              f"{r['p50_ms']:>9.1f}{r['p95_ms']:>9.1f}{r['p99_ms']:>9.1f}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
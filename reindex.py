@@ -0,0 +1,279 @@
+import time
+import threading
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from knowledge_base import (
+    PartitionedIndex, load_embedding_store, save_embedding_store, text_key
+)
+from admission import Overloaded
+
+# =========================
+# Background Re-indexing
+# =========================
+# A candidate embedding model is loaded and the whole KB re-embedded in
+# small, throttled batches on a background thread while the active index
+# keeps serving /query. When the candidate is ready it can shadow-score
+# live queries (latency and top-1 agreement) before being promoted.
+
+MAX_SHADOW_BACKLOG = 100
+
+class Reindexer:
+    """Builds and holds a candidate index for another embedding model"""
+
+    def __init__(self, load_model, embeddings_dir, batch_size=64, throttle_s=0.05, gate=nullcontext):
+        self.load_model = load_model
+        self.embeddings_dir = embeddings_dir
+        self.batch_size = batch_size
+        self.throttle_s = throttle_s
+        # Context manager factory held around each batch (admission control).
+        # It should time out (raise Overloaded) so cancellation is re-checked
+        self.gate = gate
+
+        self._lock = threading.Lock()
+        self._cancel = threading.Event()
+        self._thread = None
+        self._shadow_pool = ThreadPoolExecutor(max_workers=1)
+        self._reset(None)
+
+    def _reset(self, model_id):
+        self.model_id = model_id
+        self.model = None
+        self.index = None
+        self.vectors = {}
+        self.state = "idle" if model_id is None else "loading"
+        self.error = None
+        self.embedded = 0
+        self.total = 0
+        self.started_at = None
+        self.finished_at = None
+        self.shadow_enabled = False
+        # A fresh dict per candidate: shadow tasks still running after a
+        # reset update the old one and can't leak into the next candidate
+        self.shadow_stats = {
+            "backlog": 0,
+            "samples": 0,
+            "agreements": 0,
+            "skipped": 0,
+            "active_ms_total": 0.0,
+            "candidate_ms_total": 0.0,
+        }
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, model_id, docs, meta, on_ready=None):
+        """Start re-indexing docs with model_id; returns False if a job is running"""
+        with self._lock:
+            if self.running or self.state == "promoting":
+                return False
+            self._cancel.clear()
+            self._reset(model_id)
+            self.started_at = time.strftime("%Y-%m-%d %H:%M:%S")
+            self._thread = threading.Thread(
+                target=self._run, args=(model_id, list(docs), meta, on_ready), daemon=True
+            )
+            self._thread.start()
+            return True
+
+    def cancel(self):
+        """Discard the candidate without waiting for a running job.
+
+        The job stops at its next check. Returns False while a promotion
+        is in progress.
+        """
+        with self._lock:
+            if self.state == "promoting":
+                return False
+            if self.running:
+                self._cancel.set()
+                self.state = "cancelling"
+            else:
+                self._reset(None)
+            return True
+
+    def _discard(self, model_id):
+        with self._lock:
+            self._reset(None)
+        print(f"ℹ️ Re-index with {model_id} cancelled")
+
+    def _run(self, model_id, docs, meta, on_ready):
+        try:
+            self.model = self.load_model(model_id)
+            with self._lock:
+                if not self._cancel.is_set():
+                    self.state = "embedding"
+            if self._cancel.is_set():
+                return self._discard(model_id)
+
+            # Rows already stored for this model (e.g. an earlier attempt) are reused
+            stored_rows, stored = load_embedding_store(self.embeddings_dir, model_id)
+            pending = []
+            seen = set()
+            for d in docs:
+                key = text_key(d["text"])
+                if key in stored_rows:
+                    self.vectors[key] = stored[stored_rows[key]]
+                elif key not in seen:
+                    seen.add(key)
+                    pending.append(d["text"])
+            self.total = len(pending)
+
+            for i in range(0, len(pending), self.batch_size):
+                batch = pending[i:i + self.batch_size]
+                while True:
+                    if self._cancel.is_set():
+                        return self._discard(model_id)
+                    try:
+                        with self.gate():
+                            matrix = self.model.encode(
+                                batch,
+                                convert_to_numpy=True,
+                                normalize_embeddings=True,
+                                show_progress_bar=False
+                            )
+                        break
+                    except Overloaded:
+                        continue  # Queries kept the ingestion lane busy; wait again
+                self.vectors.update(zip((text_key(t) for t in batch), matrix))
+                self.embedded = i + len(batch)
+                # Yield CPU to the active model serving live queries
+                time.sleep(self.throttle_s)
+
+            if self._cancel.is_set():
+                return self._discard(model_id)
+            index = self.build_index(docs, meta)
+            self._save(index)
+            with self._lock:
+                if self._cancel.is_set():
+                    self._reset(None)
+                    return
+                self.index = index
+                self.state = "ready"
+                self.finished_at = time.strftime("%Y-%m-%d %H:%M:%S")
+            print(f"✅ Re-index with {model_id} ready: {len(docs)} chunks")
+            if on_ready:
+                on_ready()
+        except Exception as e:
+            self.state = "failed"
+            self.error = str(e)
+            print(f"❌ Re-index with {model_id} failed: {str(e)}")
+
+    def build_index(self, docs, meta):
+        """Candidate index for docs, encoding any chunk not seen during the job.
+
+        Used again at promotion so uploads and deletes made while the job
+        ran are reflected without re-embedding everything.
+        """
+        missing = [d["text"] for d in docs if text_key(d["text"]) not in self.vectors]
+        if missing:
+            matrix = self.model.encode(
+                missing,
+                convert_to_numpy=True,
+                normalize_embeddings=True,
+                show_progress_bar=False
+            )
+            self.vectors.update(zip((text_key(t) for t in missing), matrix))
+
+        if not docs:
+            return PartitionedIndex(self.model_id)
+        embeddings = np.vstack([self.vectors[text_key(d["text"])] for d in docs])
+        return PartitionedIndex.build(docs, embeddings, meta, model_id=self.model_id)
+
+    def _save(self, index):
+        docs, embeddings = index.live_matrix()
+        if docs:
+            save_embedding_store(self.embeddings_dir, self.model_id, [d["text"] for d in docs], embeddings)
+
+    def promote(self, docs, meta):
+        """Hand over (model_id, model, index) for the current docs and reset.
+
+        Raises RuntimeError if no candidate is ready. Catching up on chunks
+        uploaded during the job runs outside self._lock, so shadow() on the
+        query path never waits for it.
+        """
+        with self._lock:
+            if self.state != "ready":
+                raise RuntimeError("No re-indexed model is ready to promote")
+            self.state = "promoting"
+            self.shadow_enabled = False
+        try:
+            index = self.build_index(docs, meta)
+            self._save(index)
+        except Exception:
+            with self._lock:
+                self.state = "ready"
+            raise
+        with self._lock:
+            model_id, model = self.model_id, self.model
+            self._reset(None)
+        return model_id, model, index
+
+    # =========================
+    # Shadow Scoring
+    # =========================
+    def shadow(self, query, filters, active_top_id, active_ms):
+        """Score query with the candidate off the request path and record agreement"""
+        if not self.shadow_enabled or self.state != "ready":
+            return
+        with self._lock:
+            if not self.shadow_enabled or self.state != "ready":
+                return
+            stats = self.shadow_stats
+            if stats["backlog"] >= MAX_SHADOW_BACKLOG:
+                stats["skipped"] += 1
+                return
+            stats["backlog"] += 1
+            model, index = self.model, self.index
+        self._shadow_pool.submit(self._shadow_score, stats, model, index, query, filters, active_top_id, active_ms)
+
+    def _shadow_score(self, stats, model, index, query, filters, active_top_id, active_ms):
+        """Score on the shadow pool; results go to stats, the dict current at submission"""
+        try:
+            started = time.perf_counter()
+            q_emb = model.encode(
+                [query],
+                convert_to_numpy=True,
+                normalize_embeddings=True
+            )[0]
+            docs, scores = index.score(q_emb, filters)
+            candidate_ms = (time.perf_counter() - started) * 1000
+            if not docs:
+                return
+
+            candidate_top_id = docs[int(np.argmax(scores))].get("id")
+            with self._lock:
+                stats["samples"] += 1
+                stats["agreements"] += int(candidate_top_id == active_top_id)
+                stats["active_ms_total"] += active_ms
+                stats["candidate_ms_total"] += candidate_ms
+        except Exception as e:
+            print(f"⚠️ Shadow scoring failed: {str(e)}")
+        finally:
+            with self._lock:
+                stats["backlog"] -= 1
+
+    def status(self):
+        with self._lock:
+            stats = dict(self.shadow_stats)
+        samples = stats["samples"]
+        return {
+            "model": self.model_id,
+            "state": self.state,
+            "error": self.error,
+            "embedded": self.embedded,
+            "total": self.total,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "shadow": {
+                "enabled": self.shadow_enabled,
+                "samples": samples,
+                "skipped": stats["skipped"],
+                "top1_agreement": round(stats["agreements"] / samples, 3) if samples else None,
+                "active_avg_ms": round(stats["active_ms_total"] / samples, 2) if samples else None,
+                "candidate_avg_ms": round(stats["candidate_ms_total"] / samples, 2) if samples else None,
+            },
+        }
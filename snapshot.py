@@ -0,0 +1,282 @@
+"""Versioned, checksummed knowledge base snapshot bundles.
+
+A bundle is a directory snapshots/v000012/ holding the chunks, the
+embedding matrix (.npy, memory-mappable), the partition table, the
+upload log and a manifest with the model id and a SHA-256 per file.
+New nodes load a bundle instead of re-embedding the KB, and read
+replicas poll a shared snapshot directory and hot-swap to newer versions.
+
+    python snapshot.py export [--out snapshots]
+    python snapshot.py verify snapshots/v000012
+    python snapshot.py import snapshots/v000012
+"""
+import os
+import re
+import sys
+import time
+import errno
+import shutil
+import hashlib
+import argparse
+import threading
+
+import numpy as np
+
+from knowledge_base import (
+    PartitionedIndex, source_metadata, load_json, save_json, load_embedding_store, save_embedding_store,
+    text_key, configured_model, KB_FILE, UPLOAD_LOGS, EMBEDDINGS_DIR, ACTIVE_MODEL_FILE
+)
+
+SNAPSHOT_DIR = "snapshots"
+SNAPSHOT_KEEP = 5  # Older bundles are pruned after each export
+PUBLISH_ATTEMPTS = 10  # Version numbers tried when other nodes publish concurrently
+BUNDLE_FILES = ("chunks.json", "embeddings.npy", "partitions.json", "upload_logs.json")
+
+
+class SnapshotError(Exception):
+    """Raised for missing, incomplete or corrupt bundles"""
+
+
+# =========================
+# Bundle Layout
+# =========================
+def bundle_name(version):
+    return f"v{version:06d}"
+
+def list_versions(directory):
+    """Published bundle versions in directory, oldest first"""
+    if not os.path.isdir(directory):
+        return []
+    versions = []
+    for name in os.listdir(directory):
+        match = re.fullmatch(r"v(\d+)", name)
+        if match and os.path.exists(os.path.join(directory, name, "manifest.json")):
+            versions.append(int(match.group(1)))
+    return sorted(versions)
+
+def latest_bundle(directory):
+    versions = list_versions(directory)
+    return os.path.join(directory, bundle_name(versions[-1])) if versions else None
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+# =========================
+# Export
+# =========================
+def export_snapshot(directory, index, upload_logs, keep=SNAPSHOT_KEEP):
+    """Write index as the next bundle version in directory; returns the manifest"""
+    docs, embeddings, partitions = index.export()
+    if not docs:
+        raise SnapshotError("Knowledge base is empty; nothing to snapshot")
+    os.makedirs(directory, exist_ok=True)
+
+    staging = os.path.join(directory, f".staging-{os.getpid()}-{threading.get_ident()}")
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+    try:
+        save_json(os.path.join(staging, "chunks.json"), docs)
+        np.save(os.path.join(staging, "embeddings.npy"), np.asarray(embeddings, dtype=np.float32))
+        save_json(os.path.join(staging, "partitions.json"), partitions)
+        save_json(os.path.join(staging, "upload_logs.json"), upload_logs)
+
+        manifest = {
+            "model": index.model_id,
+            "created_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "chunks": len(docs),
+            "dim": int(embeddings.shape[1]),
+            "sources": len(partitions),
+            "files": {name: file_sha256(os.path.join(staging, name)) for name in BUNDLE_FILES},
+        }
+
+        # Publishing is a directory rename, so readers never see a partial
+        # bundle; if another node took the version first, try the next one
+        for _ in range(PUBLISH_ATTEMPTS):
+            versions = list_versions(directory)
+            manifest["version"] = (versions[-1] if versions else 0) + 1
+            save_json(os.path.join(staging, "manifest.json"), manifest)
+            try:
+                os.rename(staging, os.path.join(directory, bundle_name(manifest["version"])))
+                break
+            except OSError as e:
+                if e.errno not in (errno.EEXIST, errno.ENOTEMPTY):
+                    raise
+        else:
+            raise SnapshotError(f"Could not claim a snapshot version in {directory} after {PUBLISH_ATTEMPTS} attempts")
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+
+    prune_snapshots(directory, keep)
+    return manifest
+
+def prune_snapshots(directory, keep=SNAPSHOT_KEEP):
+    for version in list_versions(directory)[:-keep]:
+        try:
+            shutil.rmtree(os.path.join(directory, bundle_name(version)))
+        except OSError:
+            pass  # Still memory-mapped by a replica on this host (Windows)
+
+# =========================
+# Load / Import
+# =========================
+def read_manifest(path):
+    manifest = load_json(os.path.join(path, "manifest.json"))
+    if not isinstance(manifest, dict) or "version" not in manifest:
+        raise SnapshotError(f"No valid manifest in {path}")
+    return manifest
+
+def verify_snapshot(path):
+    """Check every file against the manifest checksums; returns the manifest"""
+    manifest = read_manifest(path)
+    for name, expected in manifest.get("files", {}).items():
+        file_path = os.path.join(path, name)
+        if not os.path.exists(file_path):
+            raise SnapshotError(f"{name} is missing from {path}")
+        if file_sha256(file_path) != expected:
+            raise SnapshotError(f"Checksum mismatch for {name} in {path}")
+    return manifest
+
+def load_snapshot(path, verify=True, mmap=True):
+    """Load a bundle; returns (manifest, docs, index, upload_logs).
+
+    With mmap the embedding matrix is memory-mapped read-only, so the
+    index is usable without reading the whole matrix into memory.
+    """
+    manifest = verify_snapshot(path) if verify else read_manifest(path)
+    docs = load_json(os.path.join(path, "chunks.json"))
+    embeddings = np.load(os.path.join(path, "embeddings.npy"), mmap_mode="r" if mmap else None)
+    partitions = load_json(os.path.join(path, "partitions.json"))
+    if len(docs) != manifest["chunks"] or embeddings.shape != (manifest["chunks"], manifest["dim"]):
+        raise SnapshotError(f"Bundle {path} does not match its manifest")
+
+    index = PartitionedIndex.from_parts(docs, embeddings, partitions, model_id=manifest["model"])
+    return manifest, docs, index, load_json(os.path.join(path, "upload_logs.json"))
+
+def import_snapshot(path, kb_file=KB_FILE, upload_logs=UPLOAD_LOGS, embeddings_dir=EMBEDDINGS_DIR):
+    """Install a bundle as this node's local KB, embedding store and active model"""
+    manifest, docs, index, logs = load_snapshot(path, mmap=False)
+    save_json(kb_file, docs)
+    save_json(upload_logs, logs)
+    save_embedding_store(embeddings_dir, manifest["model"], [d["text"] for d in docs], index.export()[1])
+    save_json(os.path.join(embeddings_dir, os.path.basename(ACTIVE_MODEL_FILE)), {
+        "model": manifest["model"],
+        "promoted_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "snapshot_version": manifest["version"]
+    })
+    return manifest
+
+# =========================
+# Read Replica
+# =========================
+class ReplicaPoller:
+    """Polls a shared snapshot directory and calls on_snapshot for newer versions.
+
+    Hot-swaps run on the poller thread and always verify checksums first;
+    a bundle that fails is skipped from then on instead of being re-read
+    on every poll.
+    """
+
+    def __init__(self, directory, interval_s, on_snapshot, current_version=0):
+        self.directory = directory
+        self.interval_s = interval_s
+        self.on_snapshot = on_snapshot
+        self.version = current_version
+        self.last_error = None
+        self.rejected = set()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def poll(self, verify=True):
+        """Load the newest bundle if it is newer than the one being served.
+
+        verify=False skips the checksums (which read every file in full) and
+        only checks the manifest against the matrix shape.
+        """
+        newer = [v for v in list_versions(self.directory) if v > self.version and v not in self.rejected]
+        for version in reversed(newer):
+            path = os.path.join(self.directory, bundle_name(version))
+            try:
+                manifest, docs, index, logs = load_snapshot(path, verify=verify)
+            except SnapshotError as e:
+                # Fall back to the next newest bundle
+                self.rejected.add(version)
+                self.last_error = str(e)
+                print(f"⚠️ Skipping snapshot: {str(e)}")
+                continue
+            self.on_snapshot(manifest, docs, index, logs)
+            self.version = manifest["version"]
+            self.last_error = None
+            return True
+        return False
+
+    def _run(self):
+        while not self._stop.wait(self.interval_s):
+            try:
+                self.poll()
+            except Exception as e:
+                # Keep serving the current version; retry on the next poll
+                self.last_error = str(e)
+                print(f"⚠️ Snapshot poll failed: {str(e)}")
+
+# =========================
+# CLI
+# =========================
+def build_local_index(model_id, kb_file=KB_FILE, embeddings_dir=EMBEDDINGS_DIR, upload_logs=UPLOAD_LOGS):
+    """Index for the local KB from the stored embeddings (no model needed)"""
+    docs = load_json(kb_file)
+    stored_rows, stored = load_embedding_store(embeddings_dir, model_id)
+    missing = [d for d in docs if text_key(d["text"]) not in stored_rows]
+    if missing:
+        raise SnapshotError(
+            f"{len(missing)} chunks have no stored {model_id} embedding; start the app or run ingest.py first"
+        )
+
+    embeddings = stored[[stored_rows[text_key(d["text"])] for d in docs]] if docs else None
+    return PartitionedIndex.build(docs, embeddings, source_metadata(docs, upload_logs), model_id=model_id)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export, verify and import knowledge base snapshot bundles.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export = commands.add_parser("export", help="Snapshot the local KB and embedding store")
+    export.add_argument("--out", default=SNAPSHOT_DIR, help="Snapshot directory")
+    export.add_argument("--model", default=None, help="Embedding model (default: the active model)")
+    export.add_argument("--keep", type=int, default=SNAPSHOT_KEEP, help="Bundles to keep")
+    verify = commands.add_parser("verify", help="Check a bundle's checksums")
+    verify.add_argument("bundle")
+    install = commands.add_parser("import", help="Install a bundle as the local KB")
+    install.add_argument("bundle", help="Bundle directory, or a snapshot directory to take the latest from")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == "export":
+            index = build_local_index(args.model or configured_model())
+            manifest = export_snapshot(args.out, index, load_json(UPLOAD_LOGS), args.keep)
+            print(f"✅ Exported snapshot v{manifest['version']}: {manifest['chunks']} chunks, model {manifest['model']}")
+        elif args.command == "verify":
+            manifest = verify_snapshot(args.bundle)
+            print(f"✅ Snapshot v{manifest['version']} is intact ({manifest['chunks']} chunks, model {manifest['model']})")
+        else:
+            path = args.bundle
+            if not os.path.exists(os.path.join(path, "manifest.json")):
+                path = latest_bundle(path)
+                if path is None:
+                    raise SnapshotError(f"No snapshots found in {args.bundle}")
+            manifest = import_snapshot(path)
+            print(f"✅ Imported snapshot v{manifest['version']}: {manifest['chunks']} chunks, model {manifest['model']}")
+    except SnapshotError as e:
+        print(f"❌ {str(e)}")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())